@@ -1,8 +1,8 @@
 # to be called only if new files are added to the data directory
-from pipeline.data_loader import load_all_documents
+from pipeline.data_loader import OptimizedDocumentLoader
 from pipeline.vectorstore import FaissVectorStore
 
 if __name__ == "__main__":
-    docs = load_all_documents("../data")
+    docs = OptimizedDocumentLoader("../data").load_lazy()
     store = FaissVectorStore("faiss_store")
     store.build_from_documents(docs)
\ No newline at end of file
@@ -1,7 +1,14 @@
-from pathlib import Path
-from typing import List, Any, Generator
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Any, Callable, Generator, Optional
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, Future,
+    as_completed, wait, FIRST_COMPLETED
+)
+from contextlib import ExitStack, contextmanager
 from functools import partial
+import io
+import os
+from queue import Queue, Full
+import threading
 import logging
 
 from langchain_community.document_loaders import (
@@ -9,67 +16,206 @@ from langchain_community.document_loaders import (
     Docx2txtLoader, JSONLoader
 )
 from langchain_community.document_loaders.excel import UnstructuredExcelLoader
+from langchain_community.document_loaders.parsers.pdf import PyPDFParser
+from langchain_core.document_loaders import Blob
+from langchain_core.documents import Document
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+LOADER_MAP = {
+    '.pdf': PyPDFLoader,
+    '.txt': TextLoader,
+    '.csv': CSVLoader,
+    '.xlsx': UnstructuredExcelLoader,
+    '.docx': Docx2txtLoader,
+    '.json': JSONLoader,
+}
+
+# Parsers that spend their time in Python-level CPU work (PDF text
+# extraction, XML parsing) and therefore need processes to escape the GIL.
+# Everything else is I/O dominated and stays on threads.
+CPU_BOUND_EXTENSIONS = {'.pdf', '.docx', '.xlsx'}
+SUPPORTED_EXTENSIONS = frozenset(LOADER_MAP)
+
+# CPU-bound formats whose parser can run on an in-memory buffer, letting the
+# file read happen on the I/O threads and only the parse in a worker process.
+BYTES_PARSED_EXTENSIONS = {'.pdf', '.docx'}
+
+
+def _extension(file_path: str) -> str:
+    """Lower-cased extension including the dot, '' if there is none."""
+    return os.path.splitext(file_path)[1].lower()
+
+
+def _file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def _load_single_file(file_path: str) -> List[Any]:
+    """Load a single file using appropriate loader.
+    
+    Module-level so it can be pickled into ProcessPoolExecutor workers.
+    """
+    extension = _extension(file_path)
+    loader_class = LOADER_MAP.get(extension)
+    
+    if not loader_class:
+        logger.warning(f"No loader for {extension}: {file_path}")
+        return []
+    
+    try:
+        loader = loader_class(file_path)
+        docs = loader.load()
+        logger.debug(f"Loaded {len(docs)} docs from {os.path.basename(file_path)}")
+        return docs
+    except Exception as e:
+        logger.error(f"Failed to load {file_path}: {e}")
+        return []
+
+
+def _read_bytes(file_path: str) -> Optional[bytes]:
+    """Read a whole file into memory (I/O stage); None if it cannot be read."""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read()
+    except OSError as e:
+        logger.error(f"Failed to load {file_path}: {e}")
+        return None
+
+
+def _parse_bytes(file_path: str, data: bytes) -> List[Any]:
+    """Parse an in-memory PDF/DOCX buffer into documents (CPU stage).
+    
+    Produces the same documents and metadata as PyPDFLoader and
+    Docx2txtLoader would for the file on disk.
+    """
+    extension = _extension(file_path)
+    source = file_path
+    
+    try:
+        if extension == '.pdf':
+            # PyPDFLoader is PyPDFParser over a file blob; parsing an in-memory
+            # blob gives the same documents (page, page_label, PDF info fields).
+            docs = list(PyPDFParser().lazy_parse(Blob.from_data(data, path=source)))
+        elif extension == '.docx':
+            import docx2txt
+            docs = [Document(page_content=docx2txt.process(io.BytesIO(data)), metadata={"source": source})]
+        else:
+            logger.warning(f"No bytes parser for {extension}: {file_path}")
+            return []
+        logger.debug(f"Loaded {len(docs)} docs from {os.path.basename(file_path)}")
+        return docs
+    except Exception as e:
+        logger.error(f"Failed to load {file_path}: {e}")
+        return []
+
+
 class OptimizedDocumentLoader:
     """
     Optimized document loader with parallel processing and lazy loading support.
     """
     
-    LOADER_MAP = {
-        '.pdf': PyPDFLoader,
-        '.txt': TextLoader,
-        '.csv': CSVLoader,
-        '.xlsx': UnstructuredExcelLoader,
-        '.docx': Docx2txtLoader,
-        '.json': JSONLoader,
-    }
+    LOADER_MAP = LOADER_MAP
     
-    def __init__(self, data_dir: str, max_workers: int = 4):
+    def __init__(self, data_dir: str, max_workers: int = 4, max_processes: Optional[int] = None):
         """
         Initialize loader.
         
         Args:
             data_dir: Directory containing documents
-            max_workers: Number of parallel workers for loading
+            max_workers: Number of I/O threads (txt/csv/json loading and
+                reading PDF/DOCX bytes)
+            max_processes: Number of processes for CPU-bound formats
+                (pdf, docx, xlsx); defaults to one less than the CPU count
         """
-        self.data_path = Path(data_dir).resolve()
+        self.data_path = os.path.realpath(data_dir)
         self.max_workers = max_workers
+        self.max_processes = max_processes or max(1, (os.cpu_count() or 2) - 1)
         logger.info(f"Initialized loader for: {self.data_path}")
     
-    def _collect_files(self) -> List[Path]:
-        """Collect all supported files in one directory traversal."""
-        supported_extensions = set(self.LOADER_MAP.keys())
+    def _collect_files(self) -> List[str]:
+        """Collect all supported files in one directory traversal.
+        
+        Walks with os.walk and filters on the raw file name, so no Path
+        object is built for the (possibly many) unsupported entries. Only
+        regular files are kept: broken symlinks and FIFOs/sockets with a
+        supported suffix are skipped (a FIFO would block open() forever).
+        Files are returned largest first (longest-processing-time order) so
+        a big PDF submitted last cannot leave the other workers idle.
+        """
+        supported_extensions = SUPPORTED_EXTENSIONS
         files = []
         
-        for item in self.data_path.rglob('*'):
-            if item.is_file() and item.suffix.lower() in supported_extensions:
-                files.append(item)
+        for root, _, filenames in os.walk(self.data_path):
+            for fn in filenames:
+                dot = fn.rfind('.')
+                if dot > 0 and fn[dot:].lower() in supported_extensions:
+                    path = os.path.join(root, fn)
+                    if os.path.isfile(path):
+                        files.append(path)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            sizes = list(executor.map(_file_size, files))
+        files = [f for _, f in sorted(zip(sizes, files), key=lambda pair: -pair[0])]
         
         logger.info(f"Found {len(files)} supported files")
         return files
     
-    def _load_single_file(self, file_path: Path) -> List[Any]:
-        """Load a single file using appropriate loader."""
-        extension = file_path.suffix.lower()
-        loader_class = self.LOADER_MAP.get(extension)
-        
-        if not loader_class:
-            logger.warning(f"No loader for {extension}: {file_path}")
-            return []
+    @contextmanager
+    def _executors(self, files: List[str]) -> Generator[Callable[[str], Future], None, None]:
+        """
+        Yield a submit(file_path) function routing each file to a pool.
         
-        try:
-            loader = loader_class(str(file_path))
-            docs = loader.load()
-            logger.debug(f"Loaded {len(docs)} docs from {file_path.name}")
-            return docs
-        except Exception as e:
-            logger.error(f"Failed to load {file_path}: {e}")
-            return []
+        I/O-bound formats load entirely on the thread pool. PDF/DOCX are
+        split in two stages: the thread pool reads the file bytes and the
+        process pool parses the buffer, so disk reads overlap with parsing.
+        Other CPU-bound formats load on the process pool directly. The
+        process pool is only started when such files are present.
+        """
+        with ExitStack() as stack:
+            processes = None
+            if any(_extension(f) in CPU_BOUND_EXTENSIONS for f in files):
+                processes = stack.enter_context(ProcessPoolExecutor(max_workers=self.max_processes))
+            # Entered last so it shuts down first: pending reads still hand
+            # their bytes to the process pool before it closes.
+            threads = stack.enter_context(ThreadPoolExecutor(max_workers=self.max_workers))
+            
+            def parse_when_read(result: Future, file_path: str, read: Future):
+                if not result.set_running_or_notify_cancel():
+                    return
+                data = read.result()
+                if data is None:
+                    # Unreadable file: already logged, skipped like in _load_single_file.
+                    result.set_result([])
+                    return
+                try:
+                    parse = processes.submit(_parse_bytes, file_path, data)
+                except Exception as e:
+                    result.set_exception(e)
+                    return
+                parse.add_done_callback(
+                    lambda f: result.set_exception(f.exception()) if f.exception() else result.set_result(f.result())
+                )
+            
+            def submit(file_path: str) -> Future:
+                extension = _extension(file_path)
+                if processes is None or extension not in CPU_BOUND_EXTENSIONS:
+                    return threads.submit(_load_single_file, file_path)
+                if extension not in BYTES_PARSED_EXTENSIONS:
+                    return processes.submit(_load_single_file, file_path)
+                result = Future()
+                threads.submit(_read_bytes, file_path).add_done_callback(
+                    partial(parse_when_read, result, file_path)
+                )
+                return result
+            
+            yield submit
     
     def load_all_parallel(self) -> List[Any]:
         """
@@ -81,12 +227,9 @@ class OptimizedDocumentLoader:
         files = self._collect_files()
         documents = []
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+        with self._executors(files) as submit:
             # Submit all tasks
-            future_to_file = {
-                executor.submit(self._load_single_file, f): f 
-                for f in files
-            }
+            future_to_file = {submit(f): f for f in files}
             
             # Collect results as they complete
             for future in as_completed(future_to_file):
@@ -100,19 +243,87 @@ class OptimizedDocumentLoader:
         logger.info(f"Loaded {len(documents)} total documents")
         return documents
     
-    def load_lazy(self) -> Generator[Any, None, None]:
+    def load_lazy(self, prefetch: int = 4) -> Generator[Any, None, None]:
         """
         Lazily load documents one at a time (memory efficient).
         
+        Files are parsed by a background thread pool that stays at most
+        `prefetch` files ahead of the consumer, so disk I/O and parsing
+        overlap with whatever the caller does (e.g. embedding) while memory
+        stays bounded regardless of corpus size.
+        
+        Args:
+            prefetch: Maximum number of parsed files buffered ahead
+        
         Yields:
             Individual documents
         """
         files = self._collect_files()
+        queue = Queue(maxsize=prefetch)
+        stop = threading.Event()
+        done = object()
         
-        for file_path in files:
-            docs = self._load_single_file(file_path)
-            for doc in docs:
-                yield doc
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    continue
+        
+        def produce():
+            try:
+                pending_files = iter(files)
+                window = self.max_workers + self.max_processes
+                with self._executors(files) as submit:
+                    in_flight = {}
+                    
+                    def submit_next():
+                        # A failed submit (e.g. a broken process pool) is
+                        # logged and skipped, like a failed load.
+                        for file_path in pending_files:
+                            try:
+                                in_flight[submit(file_path)] = file_path
+                                return
+                            except Exception as e:
+                                logger.error(f"Error submitting {file_path}: {e}")
+                    
+                    # Keep only one file per worker in flight; the bounded
+                    # queue applies back-pressure when the consumer falls behind.
+                    for _ in range(window):
+                        submit_next()
+                    while in_flight and not stop.is_set():
+                        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            file_path = in_flight.pop(future)
+                            try:
+                                put(future.result())
+                            except Exception as e:
+                                logger.error(f"Error processing {file_path}: {e}")
+                            submit_next()
+                    for future in in_flight:
+                        future.cancel()
+            except BaseException as e:
+                # Hand the error to the consumer instead of letting the stream
+                # end early as if every file had been loaded.
+                put(e)
+            finally:
+                put(done)
+        
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                docs = queue.get()
+                if docs is done:
+                    break
+                if isinstance(docs, BaseException):
+                    raise docs
+                for doc in docs:
+                    yield doc
+        finally:
+            stop.set()
+            producer.join()
     
     def load_by_type(self, file_types: List[str]) -> List[Any]:
         """
@@ -125,30 +336,31 @@ class OptimizedDocumentLoader:
             List of loaded documents
         """
         files = self._collect_files()
-        filtered_files = [f for f in files if f.suffix.lower() in file_types]
+        filtered_files = [f for f in files if _extension(f) in file_types]
         logger.info(f"Loading {len(filtered_files)} files of types {file_types}")
         
         documents = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = [executor.submit(self._load_single_file, f) for f in filtered_files]
+        with self._executors(filtered_files) as submit:
+            futures = [submit(f) for f in filtered_files]
             for future in as_completed(futures):
                 documents.extend(future.result())
         
         return documents
 
 
-def load_all_documents(data_dir: str, max_workers: int = 4) -> List[Any]:
+def load_all_documents(data_dir: str, max_workers: int = 4, max_processes: Optional[int] = None) -> List[Any]:
     """
     Convenience function matching original API.
     
     Args:
         data_dir: Directory containing documents
-        max_workers: Number of parallel workers
+        max_workers: Number of threads for I/O-bound formats
+        max_processes: Number of processes for CPU-bound formats
     
     Returns:
         List of loaded documents
     """
-    loader = OptimizedDocumentLoader(data_dir, max_workers=max_workers)
+    loader = OptimizedDocumentLoader(data_dir, max_workers=max_workers, max_processes=max_processes)
     return loader.load_all_parallel()
 
 
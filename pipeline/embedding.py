@@ -1,31 +1,127 @@
-from typing import List, Any
+import functools
+import hashlib
+import sqlite3
+from typing import List, Any, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from pipeline.data_loader import load_all_documents
 
+# Inference backends for SentenceTransformer. The ONNX variants need
+# `pip install sentence-transformers[onnx]`; "onnx-int8" loads the
+# dynamically quantized export published alongside the model.
+EMBEDDING_BACKENDS = {
+    "torch": ("torch", None),
+    "onnx": ("onnx", None),
+    "onnx-int8": ("onnx", {"file_name": "onnx/model_qint8_avx512.onnx"}),
+    "openvino": ("openvino", None),
+}
+
+
+@functools.lru_cache(maxsize=4)
+def load_embedding_model(model_name: str, backend: str = "torch") -> SentenceTransformer:
+    """
+    Load a SentenceTransformer once per (model, backend) and share it.
+
+    FaissVectorStore, EmbeddingPipeline and every RAGSearch instance reuse
+    the same weights instead of reloading them from disk.
+    """
+    import torch
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {list(EMBEDDING_BACKENDS)}")
+    st_backend, model_kwargs = EMBEDDING_BACKENDS[backend]
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return SentenceTransformer(model_name, device=device, backend=st_backend, model_kwargs=dict(model_kwargs or {}))
+
+class EmbeddingCache:
+    """
+    Persistent SQLite store of fp32 embeddings keyed by content hash.
+
+    Keys are blake2b(model_name + text) so vectors from different models never
+    mix; callers should fold anything else that changes the vectors (e.g. the
+    inference backend) into model_name. Rebuilding an index only has to embed
+    chunks that were not seen before.
+    """
+
+    # Stay under SQLite's bound-parameter limit for IN (...) lookups.
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.model_name.encode())
+        h.update(b"\0")
+        h.update(text.encode())
+        return h.digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self._key(t) for t in texts]
+        found = {}
+        for start in range(0, len(keys), self.LOOKUP_BATCH):
+            batch = keys[start:start + self.LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+            found.update(rows)
+        return [np.frombuffer(found[k], dtype=np.float32) if k in found else None for k in keys]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            ((self._key(t), v.tobytes()) for t, v in zip(texts, vectors)),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
 class EmbeddingPipeline:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200, cache: Optional[EmbeddingCache] = None, backend: str = "torch"):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.model = SentenceTransformer(model_name)
-        print(f"[INFO] Loaded embedding model: {model_name}")
-
-    def chunk_documents(self, documents: List[Any]) -> List[Any]:
-        splitter = RecursiveCharacterTextSplitter(
+        self.model = load_embedding_model(model_name, backend)
+        self.cache = cache
+        self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
-        chunks = splitter.split_documents(documents)
+        print(f"[INFO] Loaded embedding model: {model_name} ({backend})")
+
+    def chunk_documents(self, documents: List[Any]) -> List[Any]:
+        chunks = self.splitter.split_documents(documents)
         print(f"[INFO] Split {len(documents)} documents into {len(chunks)} chunks.")
         return chunks
 
     def embed_chunks(self, chunks: List[Any]) -> np.ndarray:
         texts = [chunk.page_content for chunk in chunks]
-        print(f"[INFO] Generating embeddings for {len(texts)} chunks...")
-        embeddings = self.model.encode(texts, show_progress_bar=True)
+        if self.cache is None:
+            print(f"[INFO] Generating embeddings for {len(texts)} chunks...")
+            embeddings = self.model.encode(texts, show_progress_bar=True)
+        else:
+            vectors = self.cache.get_many(texts)
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            print(f"[INFO] Generating embeddings for {len(missing)} of {len(texts)} chunks ({len(texts) - len(missing)} cached)...")
+            if missing:
+                new_texts = [texts[i] for i in missing]
+                new_vectors = self.model.encode(new_texts, batch_size=64, show_progress_bar=True)
+                self.cache.put_many(new_texts, new_vectors)
+                for i, v in zip(missing, new_vectors):
+                    vectors[i] = v
+            embeddings = np.vstack(vectors).astype(np.float32)
         print(f"[INFO] Embeddings shape: {embeddings.shape}")
         return embeddings
 
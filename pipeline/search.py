@@ -1,14 +1,49 @@
+import asyncio
+import functools
 import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
 from dotenv import load_dotenv
 from pipeline.vectorstore import FaissVectorStore
 from langchain_groq import ChatGroq
 
-load_dotenv()
+
+def _stop_loop(loop: asyncio.AbstractEventLoop, thread: threading.Thread):
+    """Stop an event loop running in thread, wait for the thread and close the loop."""
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not threading.current_thread():
+        thread.join()
+    loop.close()
+
+
+@dataclass(frozen=True)
+class _Config:
+    api_key: Optional[str]
+    faiss_nprobe: int
+    faiss_ef_search: int
+
+
+@functools.lru_cache(maxsize=1)
+def _config() -> _Config:
+    """Read .env and the environment once per process."""
+    load_dotenv()
+    return _Config(
+        api_key=os.getenv("API_KEY"),
+        faiss_nprobe=int(os.getenv("FAISS_NPROBE", 16)),
+        faiss_ef_search=int(os.getenv("FAISS_EFSEARCH", 64)),
+    )
+
 
 class RAGSearch:
     import os
 
-    def __init__(self, persist_dir: str = None, embedding_model: str = "all-MiniLM-L6-v2", llm_model: str = "llama-3.1-8b-instant"):
+    # Maximum number of concurrent LLM requests in the async batch path.
+    LLM_CONCURRENCY = 8
+
+    def __init__(self, persist_dir: str = None, embedding_model: str = "all-MiniLM-L6-v2", llm_model: str = "llama-3.1-8b-instant", quantization: Optional[str] = None, embedding_backend: str = "torch"):
         # Si persist_dir n'est pas fourni, utiliser un chemin relatif au fichier actuel
         if persist_dir is None:
             # Obtenir le dossier où se trouve CE fichier
@@ -19,45 +54,135 @@ class RAGSearch:
             persist_dir = os.path.normpath(persist_dir)
         
         print(f"[DEBUG] Looking for vector store in: {os.path.abspath(persist_dir)}")
+        config = _config()
+        
+        # Loading the embedding model and index (disk) and setting up the Groq
+        # client (network) are independent, so overlap them.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            store_ready = executor.submit(self._load_store, persist_dir, embedding_model, quantization, embedding_backend)
+            self.llm = ChatGroq(groq_api_key=config.api_key, model_name=llm_model)
+            print(f"[INFO] Groq LLM initialized: {llm_model}")
+            # Re-raises any error from the loader thread.
+            self.vectorstore = store_ready.result()
         
-        self.vectorstore = FaissVectorStore(persist_dir, embedding_model)
+        # Event loop backing the synchronous batch wrapper, started on first use
+        # and stopped by close() (or when the instance is garbage collected).
+        self._loop = None
+        self._loop_finalizer = None
+        self._loop_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _load_store(persist_dir: str, embedding_model: str, quantization: Optional[str], embedding_backend: str) -> FaissVectorStore:
+        vectorstore = FaissVectorStore(persist_dir, embedding_model, quantization=quantization, embedding_backend=embedding_backend)
         
         # Load or build vectorstore
         faiss_path = os.path.join(persist_dir, "faiss.index")
-        meta_path = os.path.join(persist_dir, "metadata.pkl")
+        meta_path = os.path.join(persist_dir, "metadata.arrow")
+        legacy_meta_path = os.path.join(persist_dir, "metadata.pkl")
+        meta_exists = os.path.exists(meta_path) or os.path.exists(legacy_meta_path)
         
-        print(f"[DEBUG] Checking for:\n  - {faiss_path}\n  - {meta_path}")
-        print(f"[DEBUG] Files exist: faiss={os.path.exists(faiss_path)}, meta={os.path.exists(meta_path)}")
+        print(f"[DEBUG] Checking for:\n  - {faiss_path}\n  - {meta_path} (or legacy {legacy_meta_path})")
+        print(f"[DEBUG] Files exist: faiss={os.path.exists(faiss_path)}, meta={meta_exists}")
         
-        if not (os.path.exists(faiss_path) and os.path.exists(meta_path)):
+        if not (os.path.exists(faiss_path) and meta_exists):
             print("**[INFO] Building vector store as it does not exist...")
-            from pipeline.data_loader import load_all_documents
+            from pipeline.data_loader import OptimizedDocumentLoader
             
             # Même correction pour le chemin data
             data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
             data_dir = os.path.normpath(data_dir)
             print(f"[DEBUG] Loading documents from: {os.path.abspath(data_dir)}")
             
-            docs = load_all_documents(data_dir)
-            self.vectorstore.build_from_documents(docs)
+            docs = OptimizedDocumentLoader(data_dir).load_lazy()
+            vectorstore.build_from_documents(docs)
         else:
             print("[INFO] Loading existing vector store...")
-            self.vectorstore.load()
-        
-        groq_api_key = os.getenv("API_KEY")
-        self.llm = ChatGroq(groq_api_key=groq_api_key, model_name=llm_model)
-        print(f"[INFO] Groq LLM initialized: {llm_model}")
-
-    def search_and_summarize(self, query: str, top_k: int = 5) -> str:
-        results = self.vectorstore.query(query, top_k=top_k)
-        texts = [r["metadata"].get("text", "") for r in results if r["metadata"]]
-        context = "\n\n".join(texts)
-        if not context:
+            vectorstore.load()
+        # Speed/recall trade-off for IVF/HNSW indexes, tunable without a rebuild.
+        config = _config()
+        vectorstore.set_search_params(nprobe=config.faiss_nprobe, ef_search=config.faiss_ef_search)
+        return vectorstore
+
+    @staticmethod
+    def _build_prompt(query: str, results: List[dict]) -> Optional[str]:
+        # Collect header, chunk texts and separators as one list of slices and
+        # join once, so the retrieved text is copied a single time.
+        parts = [f"Summarize the following context for the query: '{query}'\n\nContext:\n"]
+        for r in results:
+            md = r["metadata"]
+            if md:
+                parts.append(md.get("text", ""))
+                parts.append("\n\n")
+        if not any(parts[1::2]):
+            return None
+        parts[-1] = "\n\nSummary:"
+        return "".join(parts)
+
+    def search_and_summarize(self, query: str, top_k: int = 5, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> str:
+        with self.vectorstore.search_params(nprobe=nprobe, ef_search=ef_search):
+            results = self.vectorstore.query(query, top_k=top_k)
+        prompt = self._build_prompt(query, results)
+        if prompt is None:
             return "No relevant documents found."
-        prompt = f"""Summarize the following context for the query: '{query}'\n\nContext:\n{context}\n\nSummary:"""
         response = self.llm.invoke([prompt])
         return response.content
 
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[dict]]:
+        """Retrieve top_k chunks for every query with a single Faiss search."""
+        return self.vectorstore.query_batch(queries, top_k=top_k)
+
+    async def asearch_and_summarize(self, queries: List[str], top_k: int = 5) -> List[str]:
+        """
+        Retrieve context for all queries in one batched search, then summarize
+        them concurrently (at most LLM_CONCURRENCY requests in flight).
+        """
+        batch_results = await asyncio.to_thread(self.search_batch, queries, top_k)
+        semaphore = asyncio.Semaphore(self.LLM_CONCURRENCY)
+
+        async def summarize(query: str, results: List[dict]) -> str:
+            prompt = self._build_prompt(query, results)
+            if prompt is None:
+                return "No relevant documents found."
+            async with semaphore:
+                response = await self.llm.ainvoke([prompt])
+            return response.content
+
+        return await asyncio.gather(*(summarize(q, r) for q, r in zip(queries, batch_results)))
+
+    def _run_async(self, coro):
+        """
+        Run a coroutine on this instance's long-lived event loop and wait for it.
+
+        ChatGroq keeps one async HTTP client whose pooled connections are bound
+        to the loop they were opened on, so every call must share one loop
+        rather than spinning up a fresh one with asyncio.run.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="RAGSearch-loop", daemon=True)
+                thread.start()
+                # The thread only references the loop, so the instance can still
+                # be collected; the finalizer then stops the thread with it.
+                self._loop_finalizer = weakref.finalize(self, _stop_loop, self._loop, thread)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        """Stop the batch wrapper's event loop thread. Batch calls are not supported afterwards."""
+        with self._loop_lock:
+            if self._loop_finalizer is not None:
+                self._loop_finalizer()
+
+    def search_and_summarize_batch(self, queries: List[str], top_k: int = 5) -> List[str]:
+        """Synchronous wrapper around asearch_and_summarize."""
+        return self._run_async(self.asearch_and_summarize(queries, top_k=top_k))
+
 # Example usage
 if __name__ == "__main__":
     rag_search = RAGSearch()
@@ -1,70 +1,432 @@
 import os
+import math
+import functools
+from contextlib import contextmanager
 import faiss
 import numpy as np
 import pickle
-from typing import List, Any
-from sentence_transformers import SentenceTransformer
-from pipeline.embedding import EmbeddingPipeline
+import pyarrow as pa
+import pyarrow.feather as feather
+from itertools import islice
+from typing import List, Any, Iterable, Iterator, Optional
+from joblib import Parallel, delayed
+from pipeline.embedding import EmbeddingCache, EmbeddingPipeline, load_embedding_model
+
+class ArrowMetadata:
+    """
+    Read-only view of chunk metadata backed by a memory-mapped Arrow table.
+
+    Rows are materialised as dicts only when looked up, so loading a store
+    does not allocate one Python object per chunk.
+    """
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, idx: int) -> dict:
+        return self.table.slice(int(idx), 1).to_pylist()[0]
+
+    def to_list(self) -> List[dict]:
+        return self.table.to_pylist()
+
 
 class FaissVectorStore:
-    def __init__(self, persist_dir: str = "faiss_store", embedding_model: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
+    # None keeps full fp32 vectors; "sq8" stores 8-bit scalar codes (4x smaller),
+    # "binary" stores one sign bit per dimension (32x smaller, Hamming search).
+    QUANTIZATIONS = (None, "sq8", "binary")
+    # Arrow schema metadata key recording the quantization a store was built with.
+    QUANTIZATION_KEY = b"quantization"
+    # Chunks embedded and added per step while streaming documents in.
+    BUILD_BATCH_SIZE = 1024
+    # Documents handed to the parallel text splitter at a time.
+    SPLIT_GROUP_SIZE = 512
+    # Upper bound on vectors used to train IVF/PQ/SQ codebooks.
+    MAX_TRAIN_SAMPLES = 262_144
+    # Faiss k-means wants at least this many training points per IVF list.
+    MIN_POINTS_PER_CENTROID = 39
+    # Recently seen query strings whose embeddings are kept in memory.
+    QUERY_CACHE_SIZE = 1024
+    # Width of the SimHash used to drop near-identical chunks before indexing.
+    SIMHASH_BITS = 64
+
+    def __init__(self, persist_dir: str = "faiss_store", embedding_model: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200, quantization: Optional[str] = None, embedding_backend: str = "torch", dedupe: bool = True):
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {self.QUANTIZATIONS}")
         self.persist_dir = persist_dir
         os.makedirs(self.persist_dir, exist_ok=True)
         self.index = None
+        self._index_mmapped = False
         self.metadata = []
         self.embedding_model = embedding_model
-        self.model = SentenceTransformer(embedding_model)
+        self.embedding_backend = embedding_backend
+        self.model = load_embedding_model(embedding_model, embedding_backend)
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        print(f"[INFO] Loaded embedding model: {embedding_model}")
-
-    def build_from_documents(self, documents: List[Any]):
-        print(f"[INFO] Building vector store from {len(documents)} raw documents...")
-        emb_pipe = EmbeddingPipeline(model_name=self.embedding_model, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
-        chunks = emb_pipe.chunk_documents(documents)
-        embeddings = emb_pipe.embed_chunks(chunks)
-        metadatas = [{"text": chunk.page_content} for chunk in chunks]
-        self.add_embeddings(np.array(embeddings).astype('float32'), metadatas)
+        self.quantization = quantization
+        self.dedupe = dedupe
+        # Query hot path, bound by _specialize() once an index is available.
+        self._encode_query = None
+        self._search = None
+        print(f"[INFO] Loaded embedding model: {embedding_model} ({embedding_backend})")
+
+    def build_from_documents(self, documents: Iterable[Any]):
+        """
+        Build the index from a (possibly lazy) stream of documents.
+
+        Chunks are embedded BUILD_BATCH_SIZE at a time and spilled to a
+        temporary file, so memory stays O(batch) whatever the corpus size.
+        The spilled matrix is then memory-mapped to pick and train the index
+        and added back in batches. Chunk embeddings are cached on disk by
+        content hash, so a rebuild only encodes new or changed chunks.
+        With dedupe=True, chunks whose embedding SimHash was already seen
+        in this build (repeated boilerplate, duplicate files) are skipped.
+        """
+        print("[INFO] Building vector store from streamed documents...")
+        cache_path = os.path.join(self.persist_dir, "embeddings.sqlite")
+        spill_path = os.path.join(self.persist_dir, "embeddings.tmp")
+        n, width, dtype = 0, None, None
+        seen_hashes, planes, n_duplicates = set(), None, 0
+        self._ensure_mutable_metadata()
+        try:
+            with EmbeddingCache(cache_path, f"{self.embedding_model}:{self.embedding_backend}") as cache, open(spill_path, "wb") as spill:
+                emb_pipe = EmbeddingPipeline(model_name=self.embedding_model, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap, cache=cache, backend=self.embedding_backend)
+                for chunks in self._iter_chunk_batches(documents, emb_pipe):
+                    embeddings = np.asarray(emb_pipe.embed_chunks(chunks), dtype='float32')
+                    if self.dedupe:
+                        if planes is None:
+                            planes = self._simhash_planes(embeddings.shape[1])
+                        keep = self._first_occurrences(self._simhash(embeddings, planes), seen_hashes)
+                        if len(keep) < len(chunks):
+                            n_duplicates += len(chunks) - len(keep)
+                            chunks = [chunks[i] for i in keep]
+                            embeddings = embeddings[keep]
+                        if not chunks:
+                            continue
+                    xb = self._to_index_space(embeddings)
+                    spill.write(xb.tobytes())
+                    self.metadata.extend({"text": chunk.page_content} for chunk in chunks)
+                    n, width, dtype = n + xb.shape[0], xb.shape[1], xb.dtype
+            if n == 0:
+                print("[WARN] No chunks produced, nothing to index.")
+                return
+            xb = np.memmap(spill_path, dtype=dtype, mode="r", shape=(n, width))
+            if self.index is None:
+                self.index = self._create_index(self._training_sample(xb), ntotal=n)
+            for start in range(0, n, self.BUILD_BATCH_SIZE):
+                self.add_embeddings(np.ascontiguousarray(xb[start:start + self.BUILD_BATCH_SIZE]))
+            self._specialize()
+            del xb
+        finally:
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
         self.save()
-        print(f"[INFO] Vector store built and saved to {self.persist_dir}")
+        if n_duplicates:
+            print(f"[INFO] Skipped {n_duplicates} near-duplicate chunks.")
+        print(f"[INFO] Vector store built from {n} chunks and saved to {self.persist_dir}")
+
+    def _simhash_planes(self, dim: int) -> np.ndarray:
+        # Fixed seed so the same text always hashes the same way across builds.
+        return np.random.default_rng(0).standard_normal((dim, self.SIMHASH_BITS)).astype('float32')
+
+    @staticmethod
+    def _simhash(embeddings: np.ndarray, planes: np.ndarray) -> np.ndarray:
+        """64-bit SimHash per row: sign of the projection onto fixed random hyperplanes."""
+        bits = (embeddings @ planes) > 0
+        return np.packbits(bits, axis=1).view(np.uint64).ravel()
+
+    @staticmethod
+    def _first_occurrences(hashes: np.ndarray, seen: set) -> List[int]:
+        keep = []
+        for i, h in enumerate(hashes.tolist()):
+            if h not in seen:
+                seen.add(h)
+                keep.append(i)
+        return keep
+
+    def _iter_chunk_batches(self, documents: Iterable[Any], emb_pipe: EmbeddingPipeline) -> Iterator[List[Any]]:
+        # The recursive splitter is a pure-Python loop, so documents are split
+        # across loky worker processes; the pool stays alive for the whole build.
+        documents = iter(documents)
+        buffer = []
+        with Parallel(n_jobs=-1, backend="loky", batch_size=64) as parallel:
+            while True:
+                group = list(islice(documents, self.SPLIT_GROUP_SIZE))
+                if not group:
+                    break
+                for chunks in parallel(delayed(emb_pipe.splitter.split_documents)([doc]) for doc in group):
+                    buffer.extend(chunks)
+                while len(buffer) >= self.BUILD_BATCH_SIZE:
+                    yield buffer[:self.BUILD_BATCH_SIZE]
+                    buffer = buffer[self.BUILD_BATCH_SIZE:]
+        if buffer:
+            yield buffer
+
+    def _training_sample(self, xb: np.ndarray) -> np.ndarray:
+        n = xb.shape[0]
+        if n <= self.MAX_TRAIN_SAMPLES:
+            return np.ascontiguousarray(xb)
+        rows = np.sort(np.random.default_rng(0).choice(n, self.MAX_TRAIN_SAMPLES, replace=False))
+        return np.ascontiguousarray(xb[rows])
+
+    @classmethod
+    def _index_factory_string(cls, n: int) -> str:
+        # Faiss guidelines: brute force for small corpora, IVF with ~4*sqrt(N)
+        # lists for medium ones, compressed IVF with an HNSW coarse quantizer
+        # once memory bandwidth dominates the scan. nlist is capped so the
+        # (possibly subsampled) training set has enough points per list.
+        if n < 10_000:
+            return "Flat"
+        n_train = min(n, cls.MAX_TRAIN_SAMPLES)
+        nlist = min(int(4 * math.sqrt(n)), n_train // cls.MIN_POINTS_PER_CENTROID)
+        if n < 100_000:
+            return f"IVF{nlist},Flat"
+        return f"OPQ32_128,IVF{nlist}_HNSW32,PQ32"
+
+    def _to_index_space(self, embeddings: np.ndarray) -> np.ndarray:
+        """Convert fp32 embeddings to the representation stored in the index."""
+        x = np.array(embeddings, dtype='float32', order='C')
+        if self.quantization is None:
+            return x
+        faiss.normalize_L2(x)
+        if self.quantization == "binary":
+            return np.packbits((x > 0).astype(np.uint8), axis=1)
+        return x
+
+    def _create_index(self, xb: np.ndarray, ntotal: Optional[int] = None):
+        """Create (and train) an index sized for ntotal vectors, using xb as training data."""
+        n, dim = xb.shape
+        ntotal = n if ntotal is None else ntotal
+        if self.quantization == "binary":
+            print(f"[INFO] Created Faiss index: IndexBinaryHNSW ({dim * 8} bits)")
+            return faiss.IndexBinaryHNSW(dim * 8, 32)
+        if self.quantization == "sq8":
+            name = "IndexScalarQuantizer (QT_8bit)"
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        else:
+            name = self._index_factory_string(ntotal)
+            index = faiss.index_factory(dim, name)
+        if not index.is_trained:
+            print(f"[INFO] Training {name} index on {n} vectors...")
+            self._train(index, xb)
+        print(f"[INFO] Created Faiss index: {name}")
+        return index
+
+    @staticmethod
+    def _train(index, xb: np.ndarray):
+        """
+        Train index on xb, running IVF k-means on GPU 0 when Faiss has GPU support.
+
+        Only the k-means assignment step goes to the GPU: the index itself
+        stays on CPU, because a GPU clone converted back with
+        index_gpu_to_cpu replaces an HNSW coarse quantizer with a flat one.
+        """
+        ivf = None
+        if hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0:
+            try:
+                ivf = faiss.extract_index_ivf(index)
+            except RuntimeError:
+                pass
+        if ivf is None:
+            index.train(xb)
+            return
+        resources = faiss.StandardGpuResources()
+        clustering_index = faiss.index_cpu_to_gpu(resources, 0, faiss.IndexFlatL2(ivf.d))
+        ivf.clustering_index = clustering_index
+        print("[INFO] Running IVF k-means on GPU 0")
+        try:
+            index.train(xb)
+        finally:
+            ivf.clustering_index = None
+
+    def _search_structures(self):
+        """Return the (IVF index, HNSW graph) that hold search-time parameters, if any."""
+        if isinstance(self.index, faiss.IndexBinary):
+            return None, getattr(self.index, "hnsw", None)
+        try:
+            ivf = faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            return None, None
+        quantizer = faiss.downcast_index(ivf.quantizer)
+        return ivf, getattr(quantizer, "hnsw", None)
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Tune IVF nprobe / HNSW efSearch; None leaves a value unchanged, no-op for flat indexes."""
+        ivf, hnsw = self._search_structures()
+        if ivf is not None and nprobe is not None:
+            ivf.nprobe = nprobe
+        if hnsw is not None and ef_search is not None:
+            hnsw.efSearch = ef_search
+
+    @contextmanager
+    def search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Temporarily override search parameters, restoring the previous values on exit."""
+        ivf, hnsw = self._search_structures()
+        previous = (ivf.nprobe if ivf is not None else None, hnsw.efSearch if hnsw is not None else None)
+        self.set_search_params(nprobe, ef_search)
+        try:
+            yield
+        finally:
+            self.set_search_params(*previous)
 
     def add_embeddings(self, embeddings: np.ndarray, metadatas: List[Any] = None):
-        dim = embeddings.shape[1]
+        """Add vectors that are already in index space (see _to_index_space)."""
         if self.index is None:
-            self.index = faiss.IndexFlatL2(dim)
+            self.index = self._create_index(embeddings)
         self.index.add(embeddings)
         if metadatas:
+            self._ensure_mutable_metadata()
             self.metadata.extend(metadatas)
         print(f"[INFO] Added {embeddings.shape[0]} vectors to Faiss index.")
 
+    def _ensure_mutable_metadata(self):
+        if isinstance(self.metadata, ArrowMetadata):
+            self.metadata = self.metadata.to_list()
+
+    @staticmethod
+    def _write_replacing(path: str, write):
+        """
+        Call write(tmp_path) and rename the result over path.
+
+        A store opened with load() reads its files through memory maps, so
+        writing to them in place would truncate pages that are still being
+        read while the new file is produced.
+        """
+        tmp_path = path + ".tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def save(self):
         faiss_path = os.path.join(self.persist_dir, "faiss.index")
-        meta_path = os.path.join(self.persist_dir, "metadata.pkl")
-        faiss.write_index(self.index, faiss_path)
-        with open(meta_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        meta_path = os.path.join(self.persist_dir, "metadata.arrow")
+        if self._index_mmapped:
+            # A memory-mapped IVF index writes a reference to its on-disk
+            # lists rather than the lists themselves, so the result would not
+            # be loadable on its own.
+            raise RuntimeError("Index was loaded memory-mapped and cannot be saved; use load(mmap=False) before modifying a store")
+        write_index = faiss.write_index_binary if self.quantization == "binary" else faiss.write_index
+        self._write_replacing(faiss_path, lambda path: write_index(self.index, path))
+        if isinstance(self.metadata, ArrowMetadata):
+            table = self.metadata.table
+        else:
+            table = pa.Table.from_pylist(self.metadata)
+        # Record how vectors were encoded so load() reads the index the same way.
+        table = table.replace_schema_metadata({self.QUANTIZATION_KEY: (self.quantization or "none").encode()})
+        # Uncompressed so load() can memory-map the columns without copying.
+        self._write_replacing(meta_path, lambda path: feather.write_feather(table, path, compression="uncompressed"))
         print(f"[INFO] Saved Faiss index and metadata to {self.persist_dir}")
 
-    def load(self):
+    def _read_index(self, faiss_path: str, io_flags: int = 0):
+        if self.quantization == "binary":
+            return faiss.read_index_binary(faiss_path, io_flags)
+        return faiss.read_index(faiss_path, io_flags)
+
+    def load(self, mmap: bool = True):
+        """
+        Load the index and metadata from persist_dir.
+
+        With mmap=True the index is memory-mapped read-only so pages are
+        faulted in on demand instead of read up front; call load(mmap=False)
+        if vectors will be added to the loaded index or it will be saved.
+        """
         faiss_path = os.path.join(self.persist_dir, "faiss.index")
-        meta_path = os.path.join(self.persist_dir, "metadata.pkl")
-        self.index = faiss.read_index(faiss_path)
-        with open(meta_path, "rb") as f:
-            self.metadata = pickle.load(f)
+        meta_path = os.path.join(self.persist_dir, "metadata.arrow")
+        legacy_meta_path = os.path.join(self.persist_dir, "metadata.pkl")
+        if os.path.exists(meta_path):
+            table = feather.read_table(meta_path, memory_map=True)
+            stored = (table.schema.metadata or {}).get(self.QUANTIZATION_KEY, b"none").decode()
+            metadata = ArrowMetadata(table)
+        else:
+            # Stores written before the Arrow format kept metadata as a pickle
+            # and were always full-precision.
+            stored = "none"
+            with open(legacy_meta_path, "rb") as f:
+                metadata = pickle.load(f)
+        stored = None if stored == "none" else stored
+        if stored not in self.QUANTIZATIONS:
+            raise ValueError(f"Store in {self.persist_dir} has unknown quantization {stored!r}")
+        if stored != self.quantization:
+            print(f"[WARN] Store was built with quantization={stored!r}, not {self.quantization!r}; using {stored!r}")
+            self.quantization = stored
+        if mmap:
+            try:
+                self.index = self._read_index(faiss_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self._index_mmapped = True
+            except RuntimeError as e:
+                # Faiss builds/readers without mmap support say so in the error;
+                # anything else (corrupt file, wrong index type) is a real failure.
+                if "mmap" not in str(e).lower():
+                    raise
+                print(f"[WARN] Memory-mapped load not supported ({e}), reading index into memory")
+                self.index = self._read_index(faiss_path)
+                self._index_mmapped = False
+        else:
+            self.index = self._read_index(faiss_path)
+            self._index_mmapped = False
+        self.metadata = metadata
+        self._specialize()
         print(f"[INFO] Loaded Faiss index and metadata from {self.persist_dir}")
 
     def search(self, query_embedding: np.ndarray, top_k: int = 5):
-        D, I = self.index.search(query_embedding, top_k)
-        results = []
-        for idx, dist in zip(I[0], D[0]):
-            meta = self.metadata[idx] if idx < len(self.metadata) else None
-            results.append({"index": idx, "distance": dist, "metadata": meta})
-        return results
+        return self.search_batch(query_embedding, top_k=top_k)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5):
+        # One index.search call for the whole batch: Faiss only parallelises
+        # across queries, so submitting them together uses every core.
+        D, I = self.index.search(self._to_index_space(query_embeddings), top_k)
+        return self._collect_results(D, I)
+
+    def _collect_results(self, D: np.ndarray, I: np.ndarray):
+        metadata = self.metadata
+        n_meta = len(metadata)
+        batch_results = []
+        for ids, dists in zip(I, D):
+            results = []
+            for idx, dist in zip(ids, dists):
+                # IVF indexes pad with -1 when fewer than top_k neighbours are found
+                meta = metadata[idx] if 0 <= idx < n_meta else None
+                results.append({"index": idx, "distance": dist, "metadata": meta})
+            batch_results.append(results)
+        return batch_results
+
+    def _specialize(self):
+        """
+        Bind the single-query path to the current index.
+
+        The encoder closure converts to index space (dtype, normalisation,
+        bit packing) before its result is cached, so a repeated query goes
+        straight from the LRU to the bound index.search with no per-call
+        coercion. Re-run whenever self.index is replaced.
+        """
+        model = self.model
+        to_index_space = self._to_index_space
+
+        def encode_query(query_text: str) -> np.ndarray:
+            xq = to_index_space(model.encode([query_text]))
+            # Shared by every cache hit, so guard against in-place modification.
+            xq.setflags(write=False)
+            return xq
+
+        self._encode_query = functools.lru_cache(maxsize=self.QUERY_CACHE_SIZE)(encode_query)
+        self._search = self.index.search
 
     def query(self, query_text: str, top_k: int = 5):
         print(f"[INFO] Querying vector store for: '{query_text}'")
-        query_emb = self.model.encode([query_text]).astype('float32')
-        return self.search(query_emb, top_k=top_k)
+        if self._search is None:
+            self._specialize()
+        D, I = self._search(self._encode_query(query_text), top_k)
+        return self._collect_results(D, I)[0]
+
+    def query_batch(self, query_texts: List[str], top_k: int = 5):
+        print(f"[INFO] Querying vector store for {len(query_texts)} queries")
+        query_embs = self.model.encode(query_texts, batch_size=64)
+        return self.search_batch(query_embs, top_k=top_k)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from pipeline.data_loader import OptimizedDocumentLoader
+
+
+def test_unreadable_bytes_parsed_file_is_skipped(tmp_path):
+    missing = str(tmp_path / "missing.pdf")
+    loader = OptimizedDocumentLoader(str(tmp_path))
+
+    with loader._executors([missing]) as submit:
+        assert submit(missing).result() == []
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs POSIX FIFOs")
+def test_collect_files_skips_non_regular_files(tmp_path):
+    (tmp_path / "a.txt").write_text("hello")
+    (tmp_path / "broken.pdf").symlink_to(tmp_path / "nonexistent.pdf")
+    os.mkfifo(tmp_path / "pipe.txt")
+    loader = OptimizedDocumentLoader(str(tmp_path))
+
+    assert loader._collect_files() == [str(tmp_path / "a.txt")]
+    assert [d.page_content for d in loader.load_by_type(['.pdf', '.txt'])] == ["hello"]
@@ -0,0 +1,87 @@
+import asyncio
+import gc
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("dotenv", "faiss", "joblib", "pyarrow", "sentence_transformers", "langchain_community", "langchain_groq"):
+    pytest.importorskip(module)
+
+import pipeline.search as search
+
+
+class _FakeStore:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def load(self):
+        pass
+
+    def set_search_params(self, **kwargs):
+        pass
+
+    def query_batch(self, queries, top_k=5):
+        return [[{"index": 0, "distance": 0.0, "metadata": {"text": f"context for {q}"}}] for q in queries]
+
+
+class _LoopBoundLLM:
+    """Mimics ChatGroq's async client: pooled connections belong to the first loop that used them."""
+
+    def __init__(self, **kwargs):
+        self.loop = None
+
+    async def ainvoke(self, messages):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif self.loop is not loop:
+            raise RuntimeError("Event loop is closed" if self.loop.is_closed() else "Connection bound to another event loop")
+        return SimpleNamespace(content=f"summary ({len(messages[0])} chars)")
+
+
+@pytest.fixture
+def persist_dir(tmp_path, monkeypatch):
+    (tmp_path / "faiss.index").touch()
+    (tmp_path / "metadata.arrow").touch()
+    monkeypatch.setattr(search, "FaissVectorStore", _FakeStore)
+    monkeypatch.setattr(search, "ChatGroq", _LoopBoundLLM)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def rag(persist_dir):
+    return search.RAGSearch(persist_dir=persist_dir)
+
+
+def test_search_and_summarize_batch_reuses_event_loop(rag):
+    first = rag.search_and_summarize_batch(["what is attention?", "what is malaria?"], top_k=1)
+    second = rag.search_and_summarize_batch(["what is attention?"], top_k=1)
+
+    assert len(first) == 2 and len(second) == 1
+    assert all(s.startswith("summary") for s in first + second)
+    assert not rag.llm.loop.is_closed()
+
+
+def _loop_threads():
+    return [t for t in threading.enumerate() if t.name == "RAGSearch-loop"]
+
+
+def test_close_stops_event_loop_thread(rag):
+    before = len(_loop_threads())
+    with rag:
+        rag.search_and_summarize_batch(["what is attention?"], top_k=1)
+        assert len(_loop_threads()) == before + 1
+
+    assert len(_loop_threads()) == before
+    assert rag._loop.is_closed()
+
+
+def test_event_loop_thread_does_not_outlive_instance(persist_dir):
+    before = len(_loop_threads())
+
+    for _ in range(3):
+        search.RAGSearch(persist_dir=persist_dir).search_and_summarize_batch(["q"], top_k=1)
+    gc.collect()
+
+    assert len(_loop_threads()) == before